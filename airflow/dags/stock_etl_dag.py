@@ -1,12 +1,21 @@
 from airflow import DAG
+from airflow.decorators import task
 from airflow.operators.python import PythonOperator
 from datetime import datetime, timedelta # Ensure timedelta is imported if used
+import io
 import os
 import pandas as pd
 import psycopg2
+import psycopg2.errors
 from psycopg2 import sql
 from psycopg2.extras import execute_values
 import numpy as np
+import pyarrow as pa
+from pyarrow import csv as pacsv
+try:
+    from numba import njit
+except ImportError: # numba is optional; wilder_rsi falls back to vectorised NumPy
+    njit = None
 from sqlalchemy import create_engine # <--- THIS IMPORT IS CRUCIAL AND MUST BE AT THE TOP
 
 # Database connection details (ensure these match your docker-compose.yml)
@@ -15,35 +24,270 @@ POSTGRES_PORT = "5432"
 POSTGRES_DB = "stockdb"
 POSTGRES_USER = "airflow"
 POSTGRES_PASSWORD = "airflow"
+DB_URL = f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+
+# Airflow pool limiting concurrent per-ticker transformations (created by airflow_init in docker-compose.yml)
+TRANSFORM_POOL = "transform_pool"
+
+# Slots in TRANSFORM_POOL (keep in sync with docker-compose.yml); raw tables are split into
+# at most this many batches, one mapped transformation task per batch
+TRANSFORM_POOL_SLOTS = 8
+
+# CSV header normalization: characters to replace (' ' -> '_') or drop ('.'); add new ones here
+HEADER_TRANSLATION = str.maketrans({' ': '_', '.': ''})
+
+# --- Shared SQLAlchemy engine for ingestion and transformation ---
+# LocalExecutor runs every task in its own process, so each task instance builds one engine
+# and takes a single psycopg2 connection from it with ENGINE.raw_connection(); the overflow
+# slot covers the second connection to_sql opens on the COPY fallback path.
+ENGINE = create_engine(
+    DB_URL,
+    pool_size=1,
+    max_overflow=1,
+    pool_pre_ping=True,
+    future=True,
+)
+
+# Rolling window lengths for the feature columns
+SMA_SHORT_WINDOW = 10
+SMA_LONG_WINDOW = 50
+RSI_WINDOW = 14
+VOLATILITY_WINDOW = 30
+
+# First row (1-based, in date order) at which every window above is full;
+# the volatility window needs one extra row because the first daily return is NULL
+FEATURE_WARMUP_ROWS = max(SMA_SHORT_WINDOW, SMA_LONG_WINDOW, VOLATILITY_WINDOW + 1)
+
+# Rows fetched per round trip when streaming prices out of PostgreSQL
+STREAM_CHUNK_ROWS = 50000
+
+# Rows serialized per COPY call when loading a parsed CSV into PostgreSQL
+COPY_CHUNK_ROWS = 100000
+
+# --- RSI kernel: Wilder's recursive smoothing cannot be expressed as a SQL window frame ---
+def new_rsi_state():
+    """
+    Returns the carry-over state [previous close, avg gain, avg loss] for streaming RSI.
+    """
+    return np.array([np.nan, 0.0, 0.0])
+
+def _wilder_rsi_loop(close, state):
+    """
+    Sweeps one chunk of float32 close prices and returns float32 RSI_14 using Wilder's
+    smoothing (alpha = 1 / 14); the running averages are kept in float64.
+    `state` (see new_rsi_state) is updated in place so the next chunk continues the series.
+    """
+    n = close.shape[0]
+    rsi_14 = np.empty(n, dtype=np.float32)
+    alpha = 1.0 / RSI_WINDOW
+    prev_close = state[0]
+    avg_gain = state[1]
+    avg_loss = state[2]
+
+    for i in range(n):
+        gain = 0.0
+        loss = 0.0
+        if not np.isnan(prev_close):
+            delta = close[i] - prev_close
+            if delta > 0:
+                gain = delta
+            elif delta < 0:
+                loss = -delta
+        prev_close = close[i]
+
+        avg_gain += alpha * (gain - avg_gain)
+        avg_loss += alpha * (loss - avg_loss)
+        if avg_loss == 0:
+            rsi_14[i] = 100.0
+        else:
+            rsi_14[i] = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+    state[0] = prev_close
+    state[1] = avg_gain
+    state[2] = avg_loss
+    return rsi_14
+
+# --- Vectorised NumPy equivalent of the kernel, used when numba is not installed ---
+def _wilder_rsi_numpy(close, state):
+    """
+    Same output as _wilder_rsi_loop, computed with Wilder's EWMA over the gain/loss arrays.
+    The carried averages are prepended so the EWMA continues from the previous chunk.
+    """
+    delta = np.diff(close, prepend=state[0])
+    delta[np.isnan(delta)] = 0.0
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+    avg_gain = pd.Series(np.insert(gain, 0, state[1])).ewm(alpha=1 / RSI_WINDOW, adjust=False).mean().to_numpy()[1:]
+    avg_loss = pd.Series(np.insert(loss, 0, state[2])).ewm(alpha=1 / RSI_WINDOW, adjust=False).mean().to_numpy()[1:]
+    state[0] = close[-1]
+    state[1] = avg_gain[-1]
+    state[2] = avg_loss[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi_14 = np.where(avg_loss == 0, 100.0, 100.0 - 100.0 / (1.0 + avg_gain / avg_loss))
+    return rsi_14.astype(np.float32)
+
+wilder_rsi = njit(cache=True)(_wilder_rsi_loop) if njit else _wilder_rsi_numpy
+
+# --- In-database feature query: SMA_10, SMA_50, Daily_Return and Volatility_30 as window functions ---
+# Windows are evaluated in double precision and the derived feature columns are stored as REAL (float32);
+# close is copied at the raw table's type so source prices are never rounded.
+# Rows are ordered by (date, ctid) so repeated dates still get the same row number (rn) as the RSI stream.
+FEATURES_TABLE_QUERY = sql.SQL("""
+    CREATE TABLE {features_table} AS
+    WITH prices AS (
+        SELECT date,
+               close,
+               volume,
+               ROW_NUMBER() OVER (ORDER BY date, ctid) AS rn,
+               close::double precision / NULLIF(LAG(close) OVER (ORDER BY date, ctid), 0) - 1 AS daily_return
+        FROM {raw_table}
+        WHERE close IS NOT NULL AND volume IS NOT NULL
+    ),
+    windows AS (
+        SELECT date,
+               close,
+               volume,
+               rn,
+               AVG(close::double precision) OVER (ORDER BY rn ROWS BETWEEN {sma_short_preceding} PRECEDING AND CURRENT ROW) AS sma_10,
+               AVG(close::double precision) OVER (ORDER BY rn ROWS BETWEEN {sma_long_preceding} PRECEDING AND CURRENT ROW) AS sma_50,
+               daily_return,
+               STDDEV_SAMP(daily_return) OVER (ORDER BY rn ROWS BETWEEN {volatility_preceding} PRECEDING AND CURRENT ROW) AS volatility_30
+        FROM prices
+    )
+    SELECT w.date,
+           w.close,
+           w.volume,
+           w.sma_10::real AS "SMA_10",
+           w.sma_50::real AS "SMA_50",
+           w.daily_return::real AS "Daily_Return",
+           r.rsi_14 AS "RSI_14",
+           w.volatility_30::real AS "Volatility_30"
+    FROM windows w
+    JOIN {rsi_table} r ON r.ticker_idx = {ticker_idx} AND r.rn = w.rn
+    WHERE w.rn >= {warmup_rows}
+    ORDER BY w.rn
+""")
+
+# --- Helper functions for reading CSVs with pyarrow ---
+def read_csv_with_pyarrow(filepath):
+    """
+    Reads a CSV with pyarrow's multithreaded parser and returns the typed Arrow table.
+    ISO 'YYYY-MM-DD' columns are inferred as date32.
+    """
+    return pacsv.read_csv(filepath, parse_options=pacsv.ParseOptions(delimiter=','))
+
+def normalize_column_names(column_names):
+    return [col.strip().translate(HEADER_TRANSLATION).lower() for col in column_names]
+
+# --- pandas to_sql insert method backed by psycopg2's execute_values ---
+def psql_insert_values(table, conn, keys, data_iter):
+    """
+    Used as `method=` for DataFrame.to_sql so each chunk is sent as multi-row
+    INSERT statements (page_size rows per statement) instead of one INSERT per row.
+    """
+    target = sql.Identifier(table.schema, table.name) if table.schema else sql.Identifier(table.name)
+    columns = sql.SQL(', ').join(sql.Identifier(key) for key in keys)
+    with conn.connection.cursor() as cur:
+        insert_query = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(target, columns)
+        execute_values(cur, insert_query.as_string(cur), list(data_iter), page_size=10000)
+
+# Errors raised when a proxy or pooler in front of PostgreSQL refuses COPY FROM STDIN
+COPY_UNSUPPORTED_ERRORS = (
+    psycopg2.errors.FeatureNotSupported,
+)
+
+def postgres_column_type(column_name, arrow_type):
+    """
+    Maps an Arrow column type to the PostgreSQL type used for the raw table.
+    'date' is always DATE so PostgreSQL casts the ISO strings itself during COPY.
+    """
+    if column_name == 'date':
+        return 'DATE'
+    if pa.types.is_boolean(arrow_type):
+        return 'BOOLEAN'
+    if pa.types.is_integer(arrow_type):
+        return 'BIGINT'
+    if pa.types.is_floating(arrow_type):
+        return 'DOUBLE PRECISION'
+    if pa.types.is_decimal(arrow_type):
+        return 'NUMERIC'
+    if pa.types.is_timestamp(arrow_type):
+        return 'TIMESTAMP'
+    if pa.types.is_date(arrow_type):
+        return 'DATE'
+    return 'TEXT'
+
+def create_table_if_missing(cur, schema, table_name):
+    """
+    Issues CREATE TABLE IF NOT EXISTS with column types derived from the Arrow schema,
+    so an existing table (with its indexes and statistics) is reused as-is.
+    """
+    columns = sql.SQL(', ').join(
+        sql.SQL("{} {}").format(sql.Identifier(field.name), sql.SQL(postgres_column_type(field.name, field.type)))
+        for field in schema
+    )
+    cur.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} ({})").format(sql.Identifier(table_name), columns))
+
+def write_csv_to_postgres(conn, cur, filepath, table_name, engine):
+    """
+    Replaces the contents of a table with a CSV file: creates the table if it is missing,
+    truncates it and COPYs the parsed rows in one transaction (execute_values INSERTs
+    if COPY is refused). Returns the number of rows loaded.
+    """
+    table = sql.Identifier(table_name)
+    arrow_table = read_csv_with_pyarrow(filepath)
+    column_names = normalize_column_names(arrow_table.column_names)
+    arrow_table = arrow_table.rename_columns(column_names)
 
-# --- Helper function for calculating RSI (Relative Strength Index) ---
-def calculate_rsi(series, window=14):
-    delta = series.diff()
-    gain = delta.where(delta > 0, 0)
-    loss = -delta.where(delta < 0, 0)
-    avg_gain = gain.rolling(window=window, min_periods=1).mean()
-    avg_loss = loss.rolling(window=window, min_periods=1).mean()
-    rs = np.where(avg_loss == 0, np.inf, avg_gain / avg_loss)
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
+    create_table_if_missing(cur, arrow_table.schema, table_name)
+    cur.execute(sql.SQL("TRUNCATE TABLE {} RESTART IDENTITY").format(table))
+    try:
+        copy_query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT CSV, NULL '', FREEZE TRUE)").format(
+            table,
+            sql.SQL(', ').join(sql.Identifier(col) for col in column_names)
+        ).as_string(cur)
+        write_options = pacsv.WriteOptions(include_header=False)
+        row_count = 0
+        for batch in arrow_table.to_batches(max_chunksize=COPY_CHUNK_ROWS):
+            buffer = io.BytesIO()
+            pacsv.write_csv(batch, buffer, write_options)
+            buffer.seek(0)
+            cur.copy_expert(copy_query, buffer)
+            row_count += cur.rowcount
+        if 'date' in column_names:
+            cur.execute(sql.SQL("DELETE FROM {} WHERE date IS NULL").format(table))
+            row_count -= cur.rowcount
+        conn.commit()
+    except COPY_UNSUPPORTED_ERRORS as e:
+        print(f"COPY not available for '{table_name}' ({e}). Falling back to execute_values.")
+        conn.rollback()
+        # to_sql writes through its own connection, so the TRUNCATE must be committed first
+        create_table_if_missing(cur, arrow_table.schema, table_name)
+        cur.execute(sql.SQL("TRUNCATE TABLE {} RESTART IDENTITY").format(table))
+        conn.commit()
+        df = arrow_table.to_pandas(date_as_object=False)
+        if 'date' in df.columns:
+            df = df.dropna(subset=['date'])
+        df.to_sql(table_name, engine, if_exists='append', index=False,
+                  method=psql_insert_values, chunksize=50000)
+        row_count = len(df)
+
+    # Bulk load finished: refresh planner statistics
+    cur.execute(sql.SQL("ANALYZE {}").format(table))
+    conn.commit()
+    return row_count
 
 def ingest_data_to_postgres():
     """
     Connects to PostgreSQL and ingests data from CSV files located in /opt/airflow/data.
-    Dynamically creates or replaces tables based on CSV filenames and column headers.
+    Dynamically creates tables (if missing) based on CSV filenames and column headers,
+    then replaces their contents.
     This function is adapted for stock CSVs.
     """
-    conn_params = {
-        'host': POSTGRES_HOST, # Use defined constants
-        'dbname': POSTGRES_DB,
-        'user': POSTGRES_USER,
-        'password': POSTGRES_PASSWORD
-    }
-
     conn = None
     cur = None
     try:
-        conn = psycopg2.connect(**conn_params)
+        conn = ENGINE.raw_connection() # Pooled psycopg2 connection from the shared engine
         cur = conn.cursor()
         print("Successfully connected to PostgreSQL database from Airflow DAG for ingestion.")
 
@@ -57,35 +301,16 @@ def ingest_data_to_postgres():
             print(f"No '_ns_enriched.csv' files found in '{data_folder}'. Please ensure your stock CSVs are in the './stock_data' folder on your host.")
             return # Or raise an exception
 
-        # --- Create SQLAlchemy Engine for Pandas in ingest_data_to_postgres ---
-        # It's good practice to use SQLAlchemy engine for pandas.read_sql/to_sql
-        # even in the ingest function if you're using pandas for read/write.
-        db_connection_str = f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
-        engine = create_engine(db_connection_str)
-        print("SQLAlchemy engine created for Pandas in ingestion.")
-
         for filename in csv_files:
             filepath = os.path.join(data_folder, filename)
             print(f"Processing file for ingestion: {filepath}")
             
-            # Use SQLAlchemy engine for pd.read_csv if it's reading from DB, but here it's CSV
-            df = pd.read_csv(filepath) 
             table_name = os.path.basename(filename).replace('.csv', '').lower()
-            df.columns = [col.strip().replace(' ', '_').replace('.', '').lower() for col in df.columns]
-            df = df.where(pd.notna(df), None)
-
-            if 'date' in df.columns:
-                df['date'] = pd.to_datetime(df['date'], errors='coerce')
-                df = df.dropna(subset=['date'])
 
-            # Use psycopg2 for DDL (DROP TABLE)
-            cur.execute(sql.SQL("DROP TABLE IF EXISTS {} CASCADE").format(sql.Identifier(table_name)))
-            conn.commit()
-            print(f"Dropped existing table '{table_name}' (if any).")
-
-            # Use SQLAlchemy engine for df.to_sql
-            df.to_sql(table_name, engine, if_exists='replace', index=False)
-            print(f"Successfully inserted {len(df)} rows into table '{table_name}'.")
+            # Reuse the existing table: TRUNCATE + COPY instead of DROP + re-create.
+            # The file is parsed by pyarrow and COPYed batch by batch; no pandas conversion.
+            row_count = write_csv_to_postgres(conn, cur, filepath, table_name, ENGINE)
+            print(f"Successfully inserted {row_count} rows into table '{table_name}'.")
 
     except psycopg2.Error as e:
         print(f"Database error during ingestion: {e}")
@@ -103,101 +328,128 @@ def ingest_data_to_postgres():
             print("Ingestion database connection closed.")
 
 
-def transform_stock_data_and_store_features():
+def list_raw_stock_tables():
     """
-    Fetches raw stock data from PostgreSQL, performs feature engineering,
-    and stores the transformed data into new feature tables.
+    Returns the raw stock tables (ending with '_ns_enriched') to transform, dealt round-robin
+    into min(table count, TRANSFORM_POOL_SLOTS) batches. Each batch becomes one mapped
+    instance of the transformation task.
     """
-    conn = None # Initialize conn to None
+    conn = None
+    cursor = None
     try:
-        conn = psycopg2.connect(
-            host=POSTGRES_HOST,
-            port=POSTGRES_PORT,
-            database=POSTGRES_DB,
-            user=POSTGRES_USER,
-            password=POSTGRES_PASSWORD
-        )
-        conn.autocommit = True
+        conn = ENGINE.raw_connection() # Pooled psycopg2 connection from the shared engine
         cursor = conn.cursor()
-        print(f"Successfully connected to PostgreSQL database from Airflow DAG for transformation.")
-
-        db_connection_str = f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
-        engine = create_engine(db_connection_str)
-        print("SQLAlchemy engine created for Pandas.")
-
+        # Query pg_catalog directly; information_schema.tables is a view with extra joins and privilege checks
         cursor.execute(sql.SQL(
-            "SELECT table_name FROM information_schema.tables WHERE table_schema = 'public' AND table_name LIKE '%_ns_enriched';"
+            "SELECT c.relname FROM pg_catalog.pg_class c "
+            "JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = 'public' AND c.relkind = 'r' AND c.relname LIKE '%_ns_enriched' "
+            "ORDER BY c.relname;"
         ))
         raw_table_names = [row[0] for row in cursor.fetchall()]
 
         if not raw_table_names:
             print("No raw stock tables found (e.g., no tables ending with '_ns_enriched'). Skipping transformation.")
-            return
-
-        for raw_table_name in raw_table_names:
-            print(f"Transforming data for table: {raw_table_name}")
-            
-            # --- CRITICAL FIX HERE: Use sql.SQL and sql.Identifier to properly quote the table name ---
-            select_query = sql.SQL("SELECT date, close, volume FROM {} ORDER BY date ASC").format(
-                sql.Identifier(raw_table_name)
-            ).as_string(conn) # .as_string(conn) converts the SQL object to a plain string for pd.read_sql
-
-            df_raw = pd.read_sql(select_query, engine, parse_dates=['date'])
-            
-            if df_raw.empty:
-                print(f"No data in {raw_table_name}. Skipping transformation for this table.")
-                continue
-
-            # --- Feature Engineering using Pandas ---
-            # Make sure 'close' and 'volume' are numeric
-            df_raw['close'] = pd.to_numeric(df_raw['close'], errors='coerce')
-            df_raw['volume'] = pd.to_numeric(df_raw['volume'], errors='coerce')
-            df_raw.dropna(subset=['close', 'volume'], inplace=True) # Drop rows where close/volume couldn't be converted
-
-            if df_raw.empty:
-                print(f"No valid numeric data in {raw_table_name} after cleaning. Skipping transformation.")
-                continue
-
-            # Set 'date' as index for time-series operations
-            df_raw.set_index('date', inplace=True)
-
-            # Simple Moving Averages (using 'close')
-            df_raw['SMA_10'] = df_raw['close'].rolling(window=10).mean()
-            df_raw['SMA_50'] = df_raw['close'].rolling(window=50).mean()
-
-            # Daily Returns (using 'close')
-            df_raw['Daily_Return'] = df_raw['close'].pct_change()
-
-            # Relative Strength Index (RSI) (using 'close')
-            df_raw['RSI_14'] = calculate_rsi(df_raw['close'], window=14)
+        else:
+            print(f"Found {len(raw_table_names)} raw stock tables to transform.")
+        batch_count = min(len(raw_table_names), TRANSFORM_POOL_SLOTS)
+        return [raw_table_names[i::batch_count] for i in range(batch_count)]
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
 
-            # Volatility (Standard Deviation of Daily Returns) (using 'Daily_Return')
-            df_raw['Volatility_30'] = df_raw['Daily_Return'].rolling(window=30).std()
 
-            # Add more features as per your ML model's requirements
+def transform_stock_tables(raw_table_names):
+    """
+    Builds the feature tables for a batch of raw stock tables inside PostgreSQL.
+    SMA_10, SMA_50, Daily_Return and Volatility_30 are window functions in a
+    CREATE TABLE AS per ticker; only date/close are streamed out of the database,
+    in one pass over the whole batch, to compute RSI_14.
+    """
+    conn = None # Initialize conn to None
+    cursor = None
+    try:
+        conn = ENGINE.raw_connection() # Pooled psycopg2 connection from the shared engine
+        cursor = conn.cursor()
+        print(f"Successfully connected to PostgreSQL database from Airflow DAG for transformation.")
 
-            # Reset index to make 'date' a column again before saving to SQL
-            df_transformed = df_raw.reset_index()
+        print(f"Transforming data for tables: {', '.join(raw_table_names)}")
 
-            # Drop rows with NaN values that result from rolling window calculations
-            df_transformed.dropna(inplace=True)
+        # Stage RSI for every ticker in the batch in one temp table, keyed by the ticker's position
+        # in the batch and the row number FEATURES_TABLE_QUERY assigns to the same row
+        rsi_table_name = "batch_rsi"
+        cursor.execute(sql.SQL(
+            "CREATE TEMP TABLE {} (ticker_idx integer, rn bigint, rsi_14 real) ON COMMIT DROP"
+        ).format(sql.Identifier(rsi_table_name)))
+        insert_rsi_query = sql.SQL("INSERT INTO {} (ticker_idx, rn, rsi_14) VALUES %s").format(
+            sql.Identifier(rsi_table_name)
+        ).as_string(cursor)
+
+        # All tickers are read with a single UNION ALL query ordered by ticker, then row number
+        prices_query = sql.SQL("{} ORDER BY ticker_idx, rn").format(sql.SQL(" UNION ALL ").join(
+            sql.SQL(
+                "SELECT {} AS ticker_idx, ROW_NUMBER() OVER (ORDER BY date, ctid) AS rn, close::double precision AS close "
+                "FROM {} WHERE close IS NOT NULL AND volume IS NOT NULL"
+            ).format(sql.Literal(ticker_idx), sql.Identifier(raw_table_name))
+            for ticker_idx, raw_table_name in enumerate(raw_table_names)
+        ))
 
-            if df_transformed.empty:
-                print(f"No transformed data for {raw_table_name} after dropping NaNs. Skipping save.")
+        # RSI needs Wilder's recursive smoothing, so prices are streamed through a
+        # server-side cursor in chunks; memory stays bounded by STREAM_CHUNK_ROWS
+        row_counts = [0] * len(raw_table_names)
+        current_ticker = -1
+        rsi_state = new_rsi_state()
+        with conn.cursor(name="stream_batch_prices") as stream_cursor:
+            stream_cursor.itersize = STREAM_CHUNK_ROWS
+            stream_cursor.execute(prices_query)
+            for chunk in iter(lambda: stream_cursor.fetchmany(STREAM_CHUNK_ROWS), []):
+                tickers = np.fromiter((row[0] for row in chunk), dtype=np.int64, count=len(chunk))
+                close = np.fromiter((row[2] for row in chunk), dtype=np.float32, count=len(chunk))
+                rsi_14 = np.empty(len(chunk), dtype=np.float32)
+
+                # Split the chunk where the ticker changes; each new ticker restarts the smoothing
+                bounds = np.flatnonzero(tickers[1:] != tickers[:-1]) + 1
+                for start, stop in zip(np.r_[0, bounds], np.r_[bounds, len(chunk)]):
+                    ticker_idx = int(tickers[start])
+                    if ticker_idx != current_ticker:
+                        current_ticker = ticker_idx
+                        rsi_state = new_rsi_state()
+                    rsi_14[start:stop] = wilder_rsi(close[start:stop], rsi_state)
+                    row_counts[ticker_idx] += stop - start
+
+                execute_values(
+                    cursor,
+                    insert_rsi_query,
+                    list(zip(tickers.tolist(), (row[1] for row in chunk), rsi_14.tolist())),
+                    page_size=10000
+                )
+        cursor.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(rsi_table_name)))
+
+        for ticker_idx, raw_table_name in enumerate(raw_table_names):
+            if row_counts[ticker_idx] < FEATURE_WARMUP_ROWS:
+                print(f"Not enough valid rows in {raw_table_name} ({row_counts[ticker_idx]}) to fill the rolling windows. Skipping transformation.")
                 continue
 
             # Define the new table name for transformed features
             features_table_name = raw_table_name.replace('_ns_enriched', '_ns_features')
-            
-            # Drop existing features table if it exists (using psycopg2 connection for DDL)
-            cursor.execute(sql.SQL("DROP TABLE IF EXISTS {} CASCADE").format(sql.Identifier(features_table_name)))
-            conn.commit()
-            print(f"Dropped existing features table '{features_table_name}' (if any).")
 
-            # Store transformed data into the new table
-            df_transformed.to_sql(features_table_name, engine, if_exists='replace', index=False)
-            conn.commit()
-            print(f"Successfully transformed data and loaded into '{features_table_name}'. Rows: {len(df_transformed)}")
+            # Rebuild the features table in the batch transaction so readers never see it missing
+            cursor.execute(sql.SQL("DROP TABLE IF EXISTS {} CASCADE").format(sql.Identifier(features_table_name)))
+            cursor.execute(FEATURES_TABLE_QUERY.format(
+                features_table=sql.Identifier(features_table_name),
+                raw_table=sql.Identifier(raw_table_name),
+                rsi_table=sql.Identifier(rsi_table_name),
+                ticker_idx=sql.Literal(ticker_idx),
+                sma_short_preceding=sql.Literal(SMA_SHORT_WINDOW - 1),
+                sma_long_preceding=sql.Literal(SMA_LONG_WINDOW - 1),
+                volatility_preceding=sql.Literal(VOLATILITY_WINDOW - 1),
+                warmup_rows=sql.Literal(FEATURE_WARMUP_ROWS),
+            ))
+            print(f"Successfully transformed data and loaded into '{features_table_name}'. Rows: {cursor.rowcount}")
+
+        conn.commit()
 
     except psycopg2.Error as e:
         print(f"Database error during transformation: {e}")
@@ -235,10 +487,17 @@ with DAG(
         python_callable=ingest_data_to_postgres,
     )
 
-    transform_task = PythonOperator(
-        task_id='transform_stock_features',
-        python_callable=transform_stock_data_and_store_features,
-    )
+    @task(task_id='list_raw_stock_tables')
+    def list_tables():
+        return list_raw_stock_tables()
+
+    # One mapped task instance per batch of raw tables; the pool caps how many run at once
+    @task(task_id='transform_stock_features', pool=TRANSFORM_POOL)
+    def transform_batch(table_names):
+        transform_stock_tables(table_names)
+
+    raw_tables = list_tables()
+    transform_task = transform_batch.expand(table_names=raw_tables)
 
     # Define the task dependency: Ingestion must complete before Transformation
-    ingest_task >> transform_task
+    ingest_task >> raw_tables >> transform_task
@@ -1,7 +1,12 @@
-import pandas as pd
+import io
+from pyarrow import csv as pacsv
+import psycopg2.errors
+from psycopg2 import sql
+from psycopg2.extras import execute_batch
 from sqlalchemy import create_engine, text
 import os
 import time # Import time module for delays
+from concurrent.futures import ThreadPoolExecutor
 
 # --- Database Configuration ---
 # DB_HOST is '127.0.0.1' for explicit IPv4 connection from host to Docker-mapped port.
@@ -14,20 +19,66 @@ DB_PASSWORD = "airflow" # Matches POSTGRES_PASSWORD in your docker-compose.yml
 # Path to your stock data CSVs
 DATA_DIR = "stock_data"
 
+# Number of CSV files loaded concurrently (also the size of the SQLAlchemy connection pool)
+MAX_WORKERS = 8
+
+# Keep in sync with HEADER_TRANSLATION in airflow/dags/stock_etl_dag.py
+HEADER_TRANSLATION = str.maketrans({' ': '_', '.': ''})
+
+# Same fallback triggers as the DAG's ingestion
+COPY_UNSUPPORTED_ERRORS = (
+    psycopg2.errors.FeatureNotSupported,
+)
+
 def load_csv_to_postgres(file_path, engine):
     """Loads a single CSV file into a PostgreSQL table."""
     try:
-        df = pd.read_csv(file_path)
+        # pyarrow's multithreaded parser hands back typed columns; ISO dates are inferred as
+        # date32, and date_as_object=False converts them to datetime64 instead of boxed datetime.date
+        table = pacsv.read_csv(file_path, parse_options=pacsv.ParseOptions(delimiter=','))
+        df = table.to_pandas(date_as_object=False)
 
         table_name = os.path.basename(file_path).replace('.csv', '').lower()
         
-        df.columns = [col.strip().replace(' ', '_').replace('.', '').lower() for col in df.columns]
+        df.columns = [col.strip().translate(HEADER_TRANSLATION).lower() for col in df.columns]
 
         if 'date' in df.columns:
-            df['date'] = pd.to_datetime(df['date'], errors='coerce')
             df.dropna(subset=['date'], inplace=True)
 
-        df.to_sql(table_name, engine, if_exists='replace', index=False)
+        # Create (or replace) the empty table from the DataFrame dtypes
+        df.head(0).to_sql(table_name, engine, if_exists='replace', index=False)
+
+        # Stream the rows through COPY FROM STDIN rather than row-by-row INSERTs
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        copy_query = sql.SQL("COPY {} ({}) FROM STDIN WITH CSV").format(
+            sql.Identifier(table_name),
+            sql.SQL(', ').join(sql.Identifier(col) for col in df.columns)
+        )
+        raw_conn = engine.raw_connection()
+        cur = None
+        try:
+            cur = raw_conn.cursor()
+            try:
+                cur.copy_expert(copy_query.as_string(cur), buffer)
+            except COPY_UNSUPPORTED_ERRORS as e:
+                # Fall back to paged INSERTs; NaN is turned into None only on this path
+                print(f"COPY not available for '{table_name}' ({e}). Falling back to execute_batch.")
+                raw_conn.rollback()
+                rows = list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+                insert_query = sql.SQL("INSERT INTO {} ({}) VALUES ({})").format(
+                    sql.Identifier(table_name),
+                    sql.SQL(', ').join(sql.Identifier(col) for col in df.columns),
+                    sql.SQL(', ').join(sql.Placeholder() * len(df.columns))
+                )
+                execute_batch(cur, insert_query.as_string(cur), rows, page_size=1000)
+            raw_conn.commit()
+        finally:
+            if cur:
+                cur.close()
+            raw_conn.close()
+
         print(f"Successfully loaded {file_path} into table '{table_name}'")
     except Exception as e:
         print(f"Error loading {file_path}: {e}")
@@ -42,7 +93,8 @@ def main():
 
     for i in range(max_retries):
         try:
-            engine = create_engine(DATABASE_URL)
+            # One pooled connection per loader thread
+            engine = create_engine(DATABASE_URL, pool_size=MAX_WORKERS, max_overflow=0)
             with engine.connect() as connection:
                 connection.execute(text("SELECT 1"))
             print("Successfully connected to PostgreSQL database!")
@@ -69,9 +121,12 @@ def main():
         return
 
     print(f"Found {len(csv_files)} CSV files in '{DATA_DIR}'. Starting data loading...")
-    for csv_file in csv_files:
-        file_path = os.path.join(DATA_DIR, csv_file)
-        load_csv_to_postgres(file_path, engine)
+    # Loading is IO-bound on Postgres, so threads overlap the waits (psycopg2 releases the GIL)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        list(executor.map(
+            lambda csv_file: load_csv_to_postgres(os.path.join(DATA_DIR, csv_file), engine),
+            csv_files
+        ))
     print("Data loading complete.")
 
 if __name__ == "__main__":